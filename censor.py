@@ -1,67 +1,213 @@
 """License plate detection and video censoring module."""
 
+import logging
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+from contextlib import nullcontext
+from functools import lru_cache
+
 import cv2
+import numpy as np
+import torch
+import torch.nn.functional as F
 from pathlib import Path
+from scipy.optimize import linear_sum_assignment
 from ultralytics import YOLO
 
+# All frames of a video share one input shape, so let cuDNN pick the fastest kernels
+torch.backends.cudnn.benchmark = True
+
+logger = logging.getLogger(__name__)
+
 
 MODEL_PATH = Path(__file__).parent / "models" / "license_plate_detector.pt"
+ENGINE_PATH = MODEL_PATH.with_suffix(".engine")
 
+# Number of frames sent to the detector in a single predict call
+BATCH_SIZE = 16
 
-def load_model():
-    """Load the YOLOv8 license plate detection model.
+# Maximum number of frames buffered between the reader, detector and writer stages
+PREFETCH_SIZE = 32
+
+# Fraction of the container's reported frame count that may be missing at end
+# of file before the video is treated as truncated (the count is an estimate)
+FRAME_COUNT_TOLERANCE = 0.02
+
+# Square detector input size in pixels (also the TensorRT engine's maximum)
+IMGSZ = 640
+
+# Padding value used by Ultralytics' letterbox
+LETTERBOX_FILL = 114
+
+# Detector input sides must be multiples of the model stride
+MODEL_STRIDE = 32
+
+# Full-resolution frames staged in pinned memory for upload to the GPU
+STAGING_SLOTS = 2
+
+# Motion gate (opt-in): run the detector at least every DETECT_INTERVAL frames,
+# and on any frame whose MOTION_SIZE x MOTION_SIZE grayscale thumbnail differs
+# from the last detected frame by at least MOTION_THRESHOLD (mean absolute
+# difference). The default of 1 detects on every frame.
+DETECT_INTERVAL = 1
+MOTION_THRESHOLD = 2.0
+MOTION_SIZE = 64
+
+
+@lru_cache(maxsize=1)
+def resolve_model_path():
+    """Decide, once per process, which weights file the detector should load.
+
+    On CUDA hosts the weights are exported once to a TensorRT FP16 engine
+    cached next to the .pt file, and the engine is used on later runs. The
+    engine is checked with a warm-up inference; a cached engine that no longer
+    loads (e.g. after a TensorRT or driver upgrade) is rebuilt once. Falls back
+    to the PyTorch weights (with a warning) if no working engine can be built.
+    The result is cached, so a failed export is not retried for every model.
 
     Returns:
-        YOLO model instance configured for license plate detection.
+        Path to the TensorRT engine or to the PyTorch weights.
 
     Raises:
         FileNotFoundError: If the model file is not found.
     """
+    if torch.cuda.is_available():
+        try:
+            if ENGINE_PATH.exists():
+                try:
+                    _warm_up(YOLO(str(ENGINE_PATH), task="detect"))
+                    return ENGINE_PATH
+                except Exception as e:
+                    logger.warning("Cached TensorRT engine failed to load (%s); rebuilding it", e)
+                    ENGINE_PATH.unlink()
+            _export_engine()
+            _warm_up(YOLO(str(ENGINE_PATH), task="detect"))
+            return ENGINE_PATH
+        except Exception as e:
+            logger.warning(
+                "TensorRT engine unavailable (%s); falling back to PyTorch weights, "
+                "inference will be slower", e
+            )
+
     if not MODEL_PATH.exists():
         raise FileNotFoundError(
             f"Model not found at {MODEL_PATH}. "
             "Run: mkdir -p models && wget -O models/license_plate_detector.pt "
             '"https://github.com/Muhammad-Zeerak-Khan/Automatic-License-Plate-Recognition-using-YOLOv8/raw/refs/heads/main/license_plate_detector.pt"'
         )
-    model = YOLO(str(MODEL_PATH))
+    return MODEL_PATH
+
+
+def load_model(model_path=None):
+    """Load the YOLOv8 license plate detection model.
+
+    Args:
+        model_path: Weights to load. If None, uses resolve_model_path().
+
+    Returns:
+        YOLO model instance configured for license plate detection.
+
+    Raises:
+        FileNotFoundError: If the model file is not found.
+    """
+    if model_path is None:
+        model_path = resolve_model_path()
+    model = YOLO(str(model_path), task="detect")
     return model
 
 
-def compute_iou(box1, box2):
-    """Compute Intersection over Union between two boxes.
+def _warm_up(model):
+    """Run one dummy inference so the backend is actually loaded.
+
+    YOLO(path) only records the path; a TensorRT engine is deserialized on the
+    first predict, which is where an incompatible engine fails.
+
+    Returns:
+        The same model, ready for inference.
+    """
+    with torch.inference_mode():
+        model.predict(torch.zeros((1, 3, IMGSZ, IMGSZ)), half=True, verbose=False)
+    return model
+
+
+def _export_engine():
+    """Export the PyTorch weights to a TensorRT FP16 engine at ENGINE_PATH.
+
+    Raises:
+        FileNotFoundError: If the model file is not found.
+    """
+    if not MODEL_PATH.exists():
+        raise FileNotFoundError(f"Model not found at {MODEL_PATH}")
+
+    # Dynamic batch up to BATCH_SIZE so batched predict calls use the engine
+    exported = YOLO(str(MODEL_PATH)).export(
+        format="engine",
+        half=True,
+        dynamic=True,
+        batch=BATCH_SIZE,
+        imgsz=IMGSZ,
+        verbose=False
+    )
+    exported = Path(exported)
+    if exported != ENGINE_PATH:
+        exported.replace(ENGINE_PATH)
+
+
+def compute_iou_matrix(boxes1, boxes2):
+    """Compute pairwise Intersection over Union between two sets of boxes.
 
     Args:
-        box1, box2: Tuples of (x1, y1, x2, y2) coordinates.
+        boxes1: Array of shape (N, 4) with (x1, y1, x2, y2) rows.
+        boxes2: Array of shape (M, 4) with (x1, y1, x2, y2) rows.
 
     Returns:
-        IoU value between 0 and 1.
+        Array of shape (N, M) with IoU values between 0 and 1.
     """
-    x1 = max(box1[0], box2[0])
-    y1 = max(box1[1], box2[1])
-    x2 = min(box1[2], box2[2])
-    y2 = min(box1[3], box2[3])
+    x1 = np.maximum(boxes1[:, None, 0], boxes2[None, :, 0])
+    y1 = np.maximum(boxes1[:, None, 1], boxes2[None, :, 1])
+    x2 = np.minimum(boxes1[:, None, 2], boxes2[None, :, 2])
+    y2 = np.minimum(boxes1[:, None, 3], boxes2[None, :, 3])
+
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area1 = (boxes1[:, 2] - boxes1[:, 0]) * (boxes1[:, 3] - boxes1[:, 1])
+    area2 = (boxes2[:, 2] - boxes2[:, 0]) * (boxes2[:, 3] - boxes2[:, 1])
+    union = area1[:, None] + area2[None, :] - inter
 
-    inter = max(0, x2 - x1) * max(0, y2 - y1)
-    area1 = (box1[2] - box1[0]) * (box1[3] - box1[1])
-    area2 = (box2[2] - box2[0]) * (box2[3] - box2[1])
-    union = area1 + area2 - inter
+    return inter / np.maximum(union, 1e-9)
 
-    return inter / union if union > 0 else 0
+
+def create_stream():
+    """Create a dedicated CUDA stream for one detection worker.
+
+    Returns:
+        torch.cuda.Stream, or None when CUDA is not available.
+    """
+    return torch.cuda.Stream() if torch.cuda.is_available() else None
 
 
 class PlateTracker:
-    """Track license plates across frames to reduce flickering."""
+    """Track license plates across frames to reduce flickering.
 
-    def __init__(self, max_age=5, iou_threshold=0.3, smooth_factor=0.7):
+    Tracks live in fixed-capacity slot arrays: boxes holds (x1, y1, x2, y2)
+    per slot and ages holds frames since the last match, with -1 marking a
+    free slot. The buffers only grow if more plates are visible at once than
+    there are slots.
+    """
+
+    def __init__(self, max_age=5, iou_threshold=0.3, smooth_factor=0.7, capacity=32):
         """Initialize the tracker.
 
         Args:
             max_age: Frames to persist a track without detection.
             iou_threshold: Minimum IoU to match detection to existing track.
             smooth_factor: EMA weight for previous box (higher = smoother).
+            capacity: Initial number of track slots.
         """
-        self.tracks = {}  # track_id -> {'box': (x1,y1,x2,y2), 'age': int}
-        self.next_id = 0
+        self.boxes = np.zeros((capacity, 4), dtype=np.float32)
+        self.ages = np.full(capacity, -1, dtype=np.int32)
         self.max_age = max_age
         self.iou_threshold = iou_threshold
         self.smooth_factor = smooth_factor
@@ -70,84 +216,359 @@ class PlateTracker:
         """Update tracks with new detections.
 
         Args:
-            detections: List of (x1, y1, x2, y2) tuples from current frame.
+            detections: Float32 array of shape (Nd, 4) with (x1, y1, x2, y2) rows
+                from current frame.
 
         Returns:
-            List of boxes to censor (includes persisted tracks).
+            Array of shape (Nt, 4) with boxes to censor (includes persisted tracks).
         """
-        matched_tracks = set()
-        matched_detections = set()
-
-        # Match detections to existing tracks using greedy IoU
-        for det_idx, det_box in enumerate(detections):
-            best_iou = 0
-            best_track_id = None
-
-            for track_id, track_data in self.tracks.items():
-                if track_id in matched_tracks:
-                    continue
-                iou = compute_iou(det_box, track_data['box'])
-                if iou > best_iou and iou >= self.iou_threshold:
-                    best_iou = iou
-                    best_track_id = track_id
-
-            if best_track_id is not None:
-                # Update existing track with smoothed coordinates
-                old_box = self.tracks[best_track_id]['box']
-                sf = self.smooth_factor
-                smoothed_box = (
-                    sf * old_box[0] + (1 - sf) * det_box[0],
-                    sf * old_box[1] + (1 - sf) * det_box[1],
-                    sf * old_box[2] + (1 - sf) * det_box[2],
-                    sf * old_box[3] + (1 - sf) * det_box[3],
-                )
-                self.tracks[best_track_id]['box'] = smoothed_box
-                self.tracks[best_track_id]['age'] = 0
-                matched_tracks.add(best_track_id)
-                matched_detections.add(det_idx)
-
-        # Create new tracks for unmatched detections
-        for det_idx, det_box in enumerate(detections):
-            if det_idx not in matched_detections:
-                self.tracks[self.next_id] = {'box': det_box, 'age': 0}
-                self.next_id += 1
-
-        # Age unmatched tracks and remove expired ones
-        expired = []
-        for track_id in self.tracks:
-            if track_id not in matched_tracks:
-                self.tracks[track_id]['age'] += 1
-                if self.tracks[track_id]['age'] > self.max_age:
-                    expired.append(track_id)
-
-        for track_id in expired:
-            del self.tracks[track_id]
+        det_boxes = np.asarray(detections, dtype=np.float32).reshape(-1, 4)
+        active = np.flatnonzero(self.ages >= 0)
+        matched_tracks = np.zeros(len(self.ages), dtype=bool)
+        matched_detections = np.zeros(len(det_boxes), dtype=bool)
+
+        # Match detections to existing tracks with an optimal (Hungarian) assignment
+        # on the IoU matrix. This is O((Nd+Nt)^3), but only a handful of plates
+        # are visible per frame.
+        if len(det_boxes) and len(active):
+            iou = compute_iou_matrix(det_boxes, self.boxes[active])
+            det_indices, track_indices = linear_sum_assignment(-iou)
+            keep = iou[det_indices, track_indices] >= self.iou_threshold
+            det_indices = det_indices[keep]
+            slots = active[track_indices[keep]]
+
+            # Update existing tracks with smoothed coordinates
+            sf = self.smooth_factor
+            self.boxes[slots] = sf * self.boxes[slots] + (1 - sf) * det_boxes[det_indices]
+            self.ages[slots] = 0
+            matched_tracks[slots] = True
+            matched_detections[det_indices] = True
+
+        # Create new tracks for unmatched detections in free slots
+        new_boxes = det_boxes[~matched_detections]
+        if len(new_boxes):
+            free = np.flatnonzero(self.ages < 0)
+            if len(free) < len(new_boxes):
+                self._grow(len(new_boxes) - len(free))
+                matched_tracks = np.pad(matched_tracks, (0, len(self.ages) - len(matched_tracks)))
+                free = np.flatnonzero(self.ages < 0)
+            free = free[:len(new_boxes)]
+            self.boxes[free] = new_boxes
+            self.ages[free] = 0
+
+        # Age unmatched tracks (including new ones) and free expired slots
+        self.ages[(self.ages >= 0) & ~matched_tracks] += 1
+        self.ages[self.ages > self.max_age] = -1
 
         # Return all active track boxes
-        return [track_data['box'] for track_data in self.tracks.values()]
+        return self.boxes[self.ages >= 0].copy()
+
+    def _grow(self, extra):
+        """Add at least extra free slots, doubling the capacity when possible."""
+        extra = max(extra, len(self.ages))
+        self.boxes = np.concatenate([self.boxes, np.zeros((extra, 4), dtype=np.float32)])
+        self.ages = np.concatenate([self.ages, np.full(extra, -1, dtype=np.int32)])
 
 
-def censor_plate(frame, x1, y1, x2, y2, padding=5):
-    """Draw a solid black rectangle over the detected plate region.
+def censor_plate(frame, box, padding=5):
+    """Fill the detected plate region with a solid black rectangle.
 
     Args:
         frame: The video frame (numpy array).
-        x1, y1, x2, y2: Bounding box coordinates.
+        box: Bounding box coordinates (x1, y1, x2, y2).
         padding: Extra pixels to add around the detection for full coverage.
     """
     h, w = frame.shape[:2]
+    x1, y1, x2, y2 = box
+
+    # Add padding; skip empty boxes and boxes entirely outside the frame
+    # (negative values would otherwise wrap around as slice indices)
+    x1 = int(x1) - padding
+    y1 = int(y1) - padding
+    x2 = int(x2) + padding
+    y2 = int(y2) + padding
+    if x2 < x1 or y2 < y1 or x2 < 0 or y2 < 0 or x1 >= w or y1 >= h:
+        return
+
+    # Clamp to frame bounds
+    x1 = max(0, x1)
+    y1 = max(0, y1)
+    x2 = min(w, x2)
+    y2 = min(h, y2)
+
+    # Fill the region with black; a direct slice assignment is a plain memset and
+    # skips cv2.rectangle's drawing dispatch (+1 keeps the corner pixel inclusive)
+    frame[y1:y2 + 1, x1:x2 + 1] = 0
+
+
+class FramePreprocessor:
+    """Letterbox batches of same-sized frames into a preallocated detector input.
+
+    Video frames all share one resolution, so the resize and padding geometry
+    is computed once and the host (pinned when CUDA is available) and device
+    buffers are reused for every batch instead of being reallocated by
+    Ultralytics' preprocess on each predict call. On CUDA the raw uint8 frames
+    are uploaded and resized on the GPU; otherwise they are resized with OpenCV.
+    """
+
+    def __init__(self, frame_shape, batch_size, imgsz=IMGSZ, device=None):
+        """Compute letterbox geometry and allocate input buffers.
+
+        Args:
+            frame_shape: (height, width, ...) of the video frames.
+            batch_size: Maximum number of frames per batch.
+            imgsz: Square detector input size in pixels.
+            device: Torch device for the detector input (default: CUDA if available).
+        """
+        if device is None:
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.device = torch.device(device)
+        self.on_gpu = self.device.type == "cuda"
+
+        # Same geometry as Ultralytics' rectangular LetterBox (auto=True): the
+        # short side is only padded up to the next multiple of the model stride
+        # (e.g. 640x384 for 16:9 footage), with centered, rounded padding
+        h, w = frame_shape[:2]
+        self.frame_h, self.frame_w = h, w
+        self.ratio = min(imgsz / h, imgsz / w)
+        self.new_w = int(round(w * self.ratio))
+        self.new_h = int(round(h * self.ratio))
+        input_w = -(-self.new_w // MODEL_STRIDE) * MODEL_STRIDE
+        input_h = -(-self.new_h // MODEL_STRIDE) * MODEL_STRIDE
+        self.pad_x = int(round((input_w - self.new_w) / 2 - 0.1))
+        self.pad_y = int(round((input_h - self.new_h) / 2 - 0.1))
+
+        # Padding is written once; every batch only overwrites the image area.
+        # On CUDA the input is FP16 to match the half-precision detector.
+        self.input = torch.full(
+            (batch_size, 3, input_h, input_w), LETTERBOX_FILL / 255.0,
+            dtype=torch.float16 if self.on_gpu else torch.float32, device=self.device
+        )
+
+        if self.on_gpu:
+            # Raw frames go through two pinned staging slots: frame i+1 is copied
+            # in and uploaded while frame i is resized, without holding a whole
+            # batch of full-resolution frames in host and device memory
+            self.host = torch.empty((STAGING_SLOTS, h, w, 3), dtype=torch.uint8).pin_memory()
+            self.device_u8 = torch.empty_like(self.host, device=self.device)
+            self.upload_done = [torch.cuda.Event() for _ in range(STAGING_SLOTS)]
+        else:
+            self.host = torch.empty((batch_size, self.new_h, self.new_w, 3), dtype=torch.uint8)
+        self.host_np = self.host.numpy()
+
+    def __call__(self, frames):
+        """Letterbox BGR frames into the detector input tensor.
+
+        Args:
+            frames: List of BGR frames (numpy arrays), at most batch_size long.
+
+        Returns:
+            RGB float tensor (FP16 on CUDA) of shape (len(frames), 3, H, W) in
+            [0, 1], where H and W are the letterboxed size rounded up to the stride.
+        """
+        n = len(frames)
+        y1, x1 = self.pad_y, self.pad_x
+        y2, x2 = y1 + self.new_h, x1 + self.new_w
+        image_area = self.input[:n, :, y1:y2, x1:x2]
+
+        if self.on_gpu:
+            for i, frame in enumerate(frames):
+                slot = i % STAGING_SLOTS
+
+                # Wait until the previous upload from this slot has finished
+                self.upload_done[slot].synchronize()
+                self.host_np[slot] = frame
+                self.device_u8[slot].copy_(self.host[slot], non_blocking=True)
+                self.upload_done[slot].record()
+
+                # Resize one frame at a time to bound the float intermediate size
+                resized = F.interpolate(
+                    self.device_u8[slot:slot + 1].permute(0, 3, 1, 2).float(),
+                    size=(self.new_h, self.new_w),
+                    mode="bilinear",
+                    align_corners=False
+                )
+                image_area[i:i + 1].copy_(resized.flip(1))
+        else:
+            for i, frame in enumerate(frames):
+                cv2.resize(
+                    frame, (self.new_w, self.new_h),
+                    dst=self.host_np[i], interpolation=cv2.INTER_LINEAR
+                )
+            # BGR HWC uint8 -> RGB CHW float
+            image_area.copy_(self.host[:n].permute(0, 3, 1, 2).flip(1))
+
+        image_area.div_(255.0)
+        return self.input[:n]
+
+    def unscale(self, boxes):
+        """Map (N, 4) xyxy boxes from detector input space back to frame pixels.
+
+        Boxes are clipped to the frame, as Ultralytics' scale_boxes does, so
+        detections in the letterbox padding never yield negative coordinates.
+        """
+        boxes = boxes.copy()
+        boxes[:, [0, 2]] -= self.pad_x
+        boxes[:, [1, 3]] -= self.pad_y
+        boxes /= self.ratio
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, self.frame_w)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, self.frame_h)
+        return boxes
+
+
+@lru_cache(maxsize=1)
+def nvenc_available():
+    """Check whether ffmpeg can actually encode with h264_nvenc on this host.
+
+    ffmpeg listing h264_nvenc only reflects how it was built; GPUs without an
+    NVENC unit or containers without the NVIDIA video capability still fail
+    at encode time. A one-frame test encode catches those cases.
+
+    Returns:
+        True if a test encode with h264_nvenc succeeds.
+    """
+    if shutil.which("ffmpeg") is None or not torch.cuda.is_available():
+        return False
+    try:
+        probe = subprocess.run(
+            [
+                "ffmpeg", "-hide_banner", "-loglevel", "error",
+                "-f", "lavfi", "-i", "color=s=256x256",
+                "-frames:v", "1", "-c:v", "h264_nvenc",
+                "-f", "null", "-",
+            ],
+            capture_output=True,
+            timeout=30
+        )
+    except (OSError, subprocess.SubprocessError):
+        return False
+    return probe.returncode == 0
 
-    # Add padding and clamp to frame bounds
-    x1 = max(0, int(x1) - padding)
-    y1 = max(0, int(y1) - padding)
-    x2 = min(w, int(x2) + padding)
-    y2 = min(h, int(y2) + padding)
 
-    # Draw filled black rectangle
-    cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 0), -1)
+class FFmpegWriter:
+    """Encode BGR frames to H.264 on the GPU by piping them to ffmpeg's h264_nvenc."""
 
+    def __init__(self, output_path, fps, width, height):
+        """Start the ffmpeg encoder process.
 
-def process_video(input_path, output_path=None, progress_callback=None, conf_threshold=0.15):
+        Args:
+            output_path: Path for the output video.
+            fps: Output frame rate.
+            width, height: Frame size in pixels.
+        """
+        # stderr goes to a temp file so a chatty ffmpeg can never block on a full pipe
+        self.stderr = tempfile.TemporaryFile()
+        self.proc = subprocess.Popen(
+            [
+                "ffmpeg", "-y", "-loglevel", "error",
+                "-f", "rawvideo", "-pix_fmt", "bgr24",
+                "-s", f"{width}x{height}", "-r", str(fps),
+                "-i", "-",
+                "-c:v", "h264_nvenc", "-preset", "p4",
+                "-pix_fmt", "yuv420p",
+                str(output_path),
+            ],
+            stdin=subprocess.PIPE,
+            stderr=self.stderr
+        )
+
+    def isOpened(self):
+        """Mirror cv2.VideoWriter.isOpened: True unless ffmpeg has already exited.
+
+        Encoder failures usually surface later, on write or release.
+        """
+        return self.proc.poll() is None
+
+    def write(self, frame):
+        """Send one BGR frame to the encoder.
+
+        Raises:
+            RuntimeError: If ffmpeg has exited.
+        """
+        try:
+            self.proc.stdin.write(frame.tobytes())
+        except BrokenPipeError:
+            self.proc.wait()
+            raise RuntimeError(self._error_message()) from None
+
+    def release(self):
+        """Flush the encoder and wait for ffmpeg to finish.
+
+        Raises:
+            RuntimeError: If ffmpeg exited with an error.
+        """
+        if self.proc.stdin.closed:
+            return
+        try:
+            self.proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        try:
+            if self.proc.wait() != 0:
+                raise RuntimeError(self._error_message())
+        finally:
+            self.stderr.close()
+
+    def _error_message(self, max_chars=500):
+        """Describe ffmpeg's exit status with the tail of its stderr."""
+        self.stderr.seek(0)
+        tail = self.stderr.read().decode(errors="replace").strip()[-max_chars:]
+        message = f"ffmpeg exited with status {self.proc.returncode}"
+        return f"{message}: {tail}" if tail else message
+
+
+def _read_frames(cap, read_q, stop_event, errors):
+    """Reader stage: decode frames and push them onto the queue.
+
+    Pushes a None sentinel once the video is exhausted, reading is stopped or
+    decoding failed; decoding errors are appended to errors so the caller can
+    tell a failure from the end of the video.
+    """
+    try:
+        while not stop_event.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                break
+            read_q.put(frame)
+    except Exception as e:
+        errors.append(e)
+    finally:
+        read_q.put(None)
+
+
+def _write_frames(out, write_q, errors):
+    """Writer stage: encode frames from the queue until a None sentinel arrives.
+
+    Encoding errors are appended to errors; the queue keeps being drained so
+    the detection stage never blocks on a dead writer.
+    """
+    while True:
+        frame = write_q.get()
+        if frame is None:
+            break
+        if errors:
+            continue
+        try:
+            out.write(frame)
+        except Exception as e:
+            errors.append(e)
+
+    try:
+        out.release()
+    except Exception as e:
+        errors.append(e)
+
+
+def _motion_thumbnail(frame):
+    """Downsample a BGR frame to a small grayscale image for motion detection."""
+    small = cv2.resize(frame, (MOTION_SIZE, MOTION_SIZE), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+
+def process_video(input_path, output_path=None, progress_callback=None, conf_threshold=0.15,
+                  batch_size=BATCH_SIZE, prefetch=PREFETCH_SIZE,
+                  detect_interval=DETECT_INTERVAL, motion_threshold=MOTION_THRESHOLD,
+                  model=None, imgsz=IMGSZ, stream=None):
     """Process a video file, detecting and censoring all license plates.
 
     Args:
@@ -155,12 +576,25 @@ def process_video(input_path, output_path=None, progress_callback=None, conf_thr
         output_path: Path for the output video. If None, uses <input>_censored.mp4.
         progress_callback: Optional function(current_frame, total_frames) for progress updates.
         conf_threshold: Confidence threshold for YOLO detection (default: 0.15).
+        batch_size: Number of frames per YOLO predict call (default: 16).
+        prefetch: Maximum frames buffered between decode, detection and encode (default: 32).
+        detect_interval: Run detection at least every N frames (default: 1 = every
+            frame, motion gate off). With N > 1, skipped frames reuse the previous
+            frame's boxes, so a plate entering a static shot can stay uncensored
+            for up to N - 1 frames.
+        motion_threshold: Mean thumbnail difference that forces detection on a frame
+            when the motion gate is on (default: 2.0).
+        model: Preloaded YOLO model to reuse across calls. If None, loads one.
+        imgsz: Detector input size in pixels, a multiple of 32 up to 640 (default: 640).
+            Smaller is faster (compute scales with imgsz^2) but may miss small plates.
+        stream: Optional CUDA stream for this job's GPU work, so concurrent jobs
+            can overlap on one device (see create_stream).
 
     Returns:
         Path to the output video file.
 
     Raises:
-        ValueError: If the input file cannot be opened.
+        ValueError: If the input file cannot be opened or read, or the output cannot be written.
     """
     input_path = Path(input_path)
 
@@ -169,8 +603,13 @@ def process_video(input_path, output_path=None, progress_callback=None, conf_thr
     else:
         output_path = Path(output_path)
 
-    # Open input video
-    cap = cv2.VideoCapture(str(input_path))
+    # Open input video, using hardware decoding (NVDEC, VAAPI, ...) when available.
+    # OpenCV silently falls back to software decoding otherwise.
+    cap = cv2.VideoCapture(
+        str(input_path),
+        cv2.CAP_FFMPEG,
+        [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+    )
     if not cap.isOpened():
         raise ValueError(f"Cannot open video file: {input_path}")
 
@@ -180,60 +619,150 @@ def process_video(input_path, output_path=None, progress_callback=None, conf_thr
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
 
-    # Create video writer with mp4v codec
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(str(output_path), fourcc, fps, (width, height))
+    # Create video writer: hardware H.264 via ffmpeg when possible, else mp4v
+    if nvenc_available():
+        out = FFmpegWriter(output_path, fps, width, height)
+    else:
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        out = cv2.VideoWriter(str(output_path), fourcc, fps, (width, height))
 
     if not out.isOpened():
         cap.release()
         raise ValueError(f"Cannot create output video: {output_path}")
 
-    # Load detection model
-    model = load_model()
+    # Load detection model unless the caller shares one
+    if model is None:
+        model = load_model()
 
     # Initialize tracker for temporal smoothing
     tracker = PlateTracker(max_age=5, iou_threshold=0.3, smooth_factor=0.7)
 
-    frame_count = 0
+    # Created from the first decoded frame, whose shape is authoritative
+    preprocessor = None
 
-    try:
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
+    # Motion gate state: thumbnail of the last detected frame and its boxes
+    reference_small = None
+    boxes_to_censor = np.empty((0, 4), dtype=np.float32)
 
-            # Run license plate detection with configurable confidence threshold
-            results = model.predict(
-                frame,
-                conf=conf_threshold,
-                verbose=False
-            )
-
-            # Extract detection boxes
-            detections = []
-            for result in results:
-                for box in result.boxes:
-                    coords = box.xyxy[0].cpu().numpy()
-                    detections.append(tuple(coords))
+    frame_count = 0
 
-            # Update tracker and get smoothed boxes
-            boxes_to_censor = tracker.update(detections)
+    # Decode and encode run on their own threads so they overlap with detection
+    read_q = queue.Queue(maxsize=prefetch)
+    write_q = queue.Queue(maxsize=prefetch)
+    stop_event = threading.Event()
+    read_errors = []
+    reader = threading.Thread(target=_read_frames, args=(cap, read_q, stop_event, read_errors), daemon=True)
+    write_errors = []
+    writer = threading.Thread(target=_write_frames, args=(out, write_q, write_errors), daemon=True)
+    reader.start()
+    writer.start()
 
-            # Censor all tracked plates (including persisted ones)
-            for box in boxes_to_censor:
-                censor_plate(frame, *box)
+    try:
+        # Inference mode disables autograd tracking for the detector and preprocessing;
+        # GPU work is queued on the job's own stream when one is given
+        stream_context = torch.cuda.stream(stream) if stream is not None else nullcontext()
+        with torch.inference_mode(), stream_context:
+            eof = False
+            while not eof:
+                # Collect up to batch_size decoded frames
+                batch_frames = []
+                while len(batch_frames) < batch_size:
+                    frame = read_q.get()
+                    if frame is None:
+                        eof = True
+                        break
+                    batch_frames.append(frame)
+
+                if not batch_frames:
+                    break
+
+                if preprocessor is None:
+                    preprocessor = FramePreprocessor(batch_frames[0].shape, batch_size, imgsz=imgsz)
+
+                # Motion gate: skip detection on static frames between forced detections
+                detect_flags = []
+                for i, frame in enumerate(batch_frames):
+                    if detect_interval == 1:
+                        detect_flags.append(True)
+                        continue
+                    small = _motion_thumbnail(frame)
+                    detect = (
+                        reference_small is None
+                        or (frame_count + i) % detect_interval == 0
+                        or cv2.absdiff(reference_small, small).mean() >= motion_threshold
+                    )
+                    if detect:
+                        reference_small = small
+                    detect_flags.append(detect)
+
+                # Run license plate detection on the letterboxed frames that need it
+                detect_frames = [f for f, d in zip(batch_frames, detect_flags) if d]
+                if detect_frames:
+                    # half=True runs the PyTorch weights in FP16 on CUDA (ignored on CPU).
+                    # Note: for tensor inputs Ultralytics still copies the letterboxed
+                    # batch back to the host for its Results objects.
+                    results = iter(model.predict(
+                        preprocessor(detect_frames),
+                        conf=conf_threshold,
+                        imgsz=imgsz,
+                        half=True,
+                        verbose=False
+                    ))
+
+                # Track and censor frame-by-frame, in order
+                for frame, detect in zip(batch_frames, detect_flags):
+                    if detect:
+                        result = next(results)
+
+                        # Extract detection boxes with a single device-to-host copy per frame
+                        if len(result.boxes):
+                            detections = preprocessor.unscale(result.boxes.xyxy.cpu().numpy())
+                        else:
+                            detections = np.empty((0, 4), dtype=np.float32)
+
+                        # Update tracker and get smoothed boxes
+                        boxes_to_censor = tracker.update(detections)
+
+                    # Censor all tracked plates (including persisted ones); frames
+                    # skipped by the motion gate reuse the previous frame's boxes
+                    for box in boxes_to_censor:
+                        censor_plate(frame, box)
+
+                    # Hand censored frame to the writer
+                    write_q.put(frame)
+
+                    frame_count += 1
+
+                    # Report progress
+                    if progress_callback:
+                        progress_callback(frame_count, total_frames)
 
-            # Write censored frame
-            out.write(frame)
+    finally:
+        # Stop the reader, draining the queue so it is never blocked on put
+        stop_event.set()
+        while reader.is_alive():
+            try:
+                read_q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        reader.join()
+
+        # Flush remaining frames; the writer releases the output when done
+        write_q.put(None)
+        writer.join()
 
-            frame_count += 1
+        cap.release()
 
-            # Report progress
-            if progress_callback:
-                progress_callback(frame_count, total_frames)
+    if read_errors:
+        raise ValueError(f"Cannot read input video: {read_errors[0]}")
 
-    finally:
-        cap.release()
-        out.release()
+    # cv2 reports a mid-stream decode failure as end of file, so compare with the
+    # container's (approximate) frame count to catch truncated output
+    if total_frames > 0 and frame_count < total_frames * (1 - FRAME_COUNT_TOLERANCE):
+        raise ValueError(
+            f"Cannot read input video: decoding stopped at frame {frame_count} of {total_frames}"
+        )
+    if write_errors:
+        raise ValueError(f"Cannot write output video: {write_errors[0]}")
 
     return output_path
@@ -1,7 +1,12 @@
 """License Plate Censor - FastAPI web application for censoring license plates in videos."""
 
 import asyncio
+import queue
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
 from pathlib import Path
 from typing import Optional
 
@@ -10,34 +15,81 @@ from fastapi.responses import FileResponse, StreamingResponse, HTMLResponse
 from fastapi.staticfiles import StaticFiles
 import uvicorn
 
-from censor import process_video
+from censor import (
+    BATCH_SIZE,
+    DETECT_INTERVAL,
+    IMGSZ,
+    MOTION_THRESHOLD,
+    create_stream,
+    load_model,
+    process_video,
+    resolve_model_path,
+)
 
-app = FastAPI(title="License Plate Censor")
+# Number of videos processed concurrently. The YOLO predictor is not reentrant,
+# so each worker borrows its own model and CUDA stream from the pool.
+DETECTION_WORKERS = 2
+
+detection_executor = ThreadPoolExecutor(max_workers=DETECTION_WORKERS)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load one detection model per worker, before the server accepts requests."""
+    # Choose engine vs .pt once, so a failing TensorRT export isn't retried per worker
+    model_path = resolve_model_path()
+    app.state.model_pool = queue.Queue()
+    for _ in range(DETECTION_WORKERS):
+        app.state.model_pool.put((load_model(model_path), create_stream()))
+    yield
+    detection_executor.shutdown(wait=False, cancel_futures=True)
+
+
+app = FastAPI(title="License Plate Censor", lifespan=lifespan)
 
 # Store for progress tracking
 progress_store = {}
 
+# job_id -> asyncio.Event that is set (and replaced) whenever the job's progress changes
+progress_events = {}
+
+# Minimum seconds between progress notifications sent to SSE streams
+PROGRESS_INTERVAL = 0.25
+
 # Temporary storage for uploaded and processed videos
 UPLOAD_DIR = Path("uploads")
 OUTPUT_DIR = Path("outputs")
 UPLOAD_DIR.mkdir(exist_ok=True)
 OUTPUT_DIR.mkdir(exist_ok=True)
 
+# Uploads are copied to disk in chunks of this size (1 MiB)
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# The single-page UI is read once at startup instead of on every request
+INDEX_HTML_PATH = Path(__file__).parent / "static" / "index.html"
+INDEX_HTML = INDEX_HTML_PATH.read_bytes() if INDEX_HTML_PATH.exists() else None
+
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root():
     """Serve the main HTML page."""
-    html_file = Path(__file__).parent / "static" / "index.html"
-    if not html_file.exists():
+    if INDEX_HTML is None:
         return HTMLResponse(
             content="<h1>Static files not found</h1><p>Please ensure static/index.html exists.</p>",
             status_code=500
         )
-    return FileResponse(html_file)
+    return HTMLResponse(content=INDEX_HTML)
 
 
 @app.post("/upload")
-async def upload_video(file: UploadFile = File(...), threshold: float = Form(0.15)):
+async def upload_video(
+    file: UploadFile = File(...),
+    threshold: float = Form(0.15),
+    batch_size: int = Form(BATCH_SIZE),
+    imgsz: int = Form(IMGSZ),
+    detect_interval: int = Form(DETECT_INTERVAL),
+    motion_threshold: float = Form(MOTION_THRESHOLD),
+):
     """Handle video upload and start processing."""
 
     # Validate file type
@@ -48,14 +100,32 @@ async def upload_video(file: UploadFile = File(...), threshold: float = Form(0.1
     if not 0.0 <= threshold <= 1.0:
         raise HTTPException(status_code=400, detail="Threshold must be between 0.0 and 1.0")
 
+    # Validate batch size
+    # (the TensorRT engine is exported with a maximum batch of BATCH_SIZE)
+    if not 1 <= batch_size <= BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Batch size must be between 1 and {BATCH_SIZE}")
+
+    # Validate detection resolution (the detector needs multiples of 32)
+    if not 320 <= imgsz <= IMGSZ or imgsz % 32:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Detection resolution must be a multiple of 32 between 320 and {IMGSZ}"
+        )
+
+    # Validate motion gate settings
+    if not 1 <= detect_interval <= 30:
+        raise HTTPException(status_code=400, detail="Detection interval must be between 1 and 30")
+    if not 0.0 <= motion_threshold <= 255.0:
+        raise HTTPException(status_code=400, detail="Motion threshold must be between 0.0 and 255.0")
+
     # Generate unique ID for this job
     job_id = str(uuid.uuid4())
 
-    # Save uploaded file
+    # Save uploaded file, streaming it to disk in chunks
     input_path = UPLOAD_DIR / f"{job_id}_{file.filename}"
     with open(input_path, "wb") as f:
-        content = await file.read()
-        f.write(content)
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            f.write(chunk)
 
     # Initialize progress
     progress_store[job_id] = {
@@ -66,34 +136,87 @@ async def upload_video(file: UploadFile = File(...), threshold: float = Form(0.1
         "message": "Starting...",
         "output_path": None
     }
+    progress_events[job_id] = asyncio.Event()
 
     # Start processing in background
-    asyncio.create_task(process_video_task(job_id, input_path, threshold))
+    asyncio.create_task(process_video_task(
+        job_id, input_path, threshold, batch_size, imgsz, detect_interval, motion_threshold
+    ))
 
     return {"job_id": job_id, "message": "Upload successful, processing started"}
 
 
-async def process_video_task(job_id: str, input_path: Path, threshold: float = 0.15):
+def run_detection_job(*args, **kwargs):
+    """Run process_video with a model and CUDA stream borrowed from the pool."""
+    model_pool = app.state.model_pool
+    model, stream = model_pool.get()
+    try:
+        return process_video(*args, model=model, stream=stream, **kwargs)
+    finally:
+        model_pool.put((model, stream))
+
+
+def notify_progress(job_id: str):
+    """Wake every SSE stream waiting on a job. Must run on the event loop thread."""
+    event = progress_events.get(job_id)
+    if event is not None:
+        progress_events[job_id] = asyncio.Event()
+        event.set()
+
+
+async def process_video_task(
+    job_id: str,
+    input_path: Path,
+    threshold: float = 0.15,
+    batch_size: int = BATCH_SIZE,
+    imgsz: int = IMGSZ,
+    detect_interval: int = DETECT_INTERVAL,
+    motion_threshold: float = MOTION_THRESHOLD,
+):
     """Process video in background and update progress."""
+    loop = asyncio.get_running_loop()
+
     try:
         output_path = OUTPUT_DIR / f"{input_path.stem}_censored.mp4"
 
+        last_notify = 0.0
+
         def progress_callback(current, total):
+            nonlocal last_notify
             percent = int((current / total) * 100) if total > 0 else 0
+            if total > 0:
+                message = f"Processing frame {current}/{total} ({percent}%)"
+            else:
+                # Some containers don't report a frame count
+                message = f"Processing frame {current}"
             progress_store[job_id].update({
                 "current": current,
                 "total": total,
                 "percent": percent,
-                "message": f"Processing frame {current}/{total} ({percent}%)"
+                "message": message
             })
 
-        # Run the video processing (blocking operation)
-        await asyncio.to_thread(
-            process_video,
-            input_path,
-            output_path,
-            progress_callback,
-            threshold
+            # Runs in the worker thread: notify listeners on the event loop,
+            # at most every PROGRESS_INTERVAL seconds rather than on every frame
+            now = time.monotonic()
+            if now - last_notify >= PROGRESS_INTERVAL:
+                last_notify = now
+                loop.call_soon_threadsafe(notify_progress, job_id)
+
+        # Run the video processing (blocking operation) on a detection worker
+        await loop.run_in_executor(
+            detection_executor,
+            partial(
+                run_detection_job,
+                input_path,
+                output_path,
+                progress_callback,
+                threshold,
+                batch_size,
+                imgsz=imgsz,
+                detect_interval=detect_interval,
+                motion_threshold=motion_threshold
+            )
         )
 
         # Update with completion status
@@ -111,6 +234,8 @@ async def process_video_task(job_id: str, input_path: Path, threshold: float = 0
             "message": f"Error: {str(e)}"
         })
 
+    notify_progress(job_id)
+
 
 @app.get("/progress/{job_id}")
 async def get_progress(job_id: str):
@@ -123,6 +248,8 @@ async def get_progress(job_id: str):
                 yield f"data: {{'error': 'Job not found'}}\n\n"
                 break
 
+            # Grab the event before sending so no update in between is missed
+            event = progress_events[job_id]
             progress = progress_store[job_id]
 
             # Send current progress as JSON
@@ -133,7 +260,8 @@ async def get_progress(job_id: str):
             if progress["status"] in ["complete", "error"]:
                 break
 
-            await asyncio.sleep(0.5)  # Update every 500ms
+            # Wait until the job reports new progress
+            await event.wait()
 
     return StreamingResponse(
         event_generator(),